@@ -1,5 +1,10 @@
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+
 import streamlit as st
-from groq import Groq
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(
@@ -15,37 +20,193 @@ try:
 except (FileNotFoundError, KeyError):
     pass 
 
+# One fenced block per match, info line and closing fence consumed, so blocks are found in order
+# and a closing fence is never mistaken for an opening one. A missing closing fence
+# (cut-off reply) runs to the end. CRLF line endings are accepted.
+_FENCE_RE = re.compile(r"^[ \t]*```(?P<info>[^\n`]*)\n(?P<code>.*?)(?:^[ \t]*```[ \t]*\r?$|\Z)", re.DOTALL | re.MULTILINE)
+_PYTHON_TAGS = {"python", "python3", "py"}
+
 # --- 3. THE BRAIN (STRICT & COMPLETE LOGIC) ---
-SYSTEM_LOGIC = """
-[ROLE]
-You are a Senior Python Developer. You DO NOT write pseudo-code or simple examples.
-You write **Complete, Functional, and Production-Ready** Streamlit applications.
-
-[STRICT ARCHITECTURE RULES]
-1. **Completeness**: The code must run immediately without errors. Include ALL imports.
-2. **Complexity**: 
-   - If the user asks for a game (like Candy Crush), implement the ACTUAL game logic (grid, swapping, score), not just a placeholder.
-   - If the user asks for a financial app, implement dataframes, charts, and calculations.
-3. **Structure**:
-   - Use `st.set_page_config` first.
-   - Use `if __name__ == "__main__": main()` pattern.
-   - Use `st.session_state` for all interactive variables.
-
-[OUTPUT FORMAT - DO NOT DEVIATE]
-You must provide the response in THREE distinct sections:
-
----
-### SECTION 1: THE CODE
-(Provide the FULL, LONG, WORKING Python code block. Do not cut it short.)
-
----
-### SECTION 2: EXPLANATION
-(Briefly explain the key functions and how the logic works.)
-
----
-### SECTION 3: SETUP
-(List exactly what to put in `requirements.txt`. Example: `streamlit`, `pandas`, `numpy`)
-"""
+@st.cache_data(show_spinner=False)
+def load_prompt(path: str, mtime: float):
+    """Read a prompt file and its blake2b digest; `mtime` in the key picks up edits without a restart."""
+    text = Path(path).read_text(encoding="utf-8")
+    return text, hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+# SYSTEM_HASH stands in for the prompt in cache keys
+SYSTEM_PROMPT_PATH = Path(__file__).parent / "prompts" / "builder.md"
+SYSTEM_LOGIC, SYSTEM_HASH = load_prompt(str(SYSTEM_PROMPT_PATH), SYSTEM_PROMPT_PATH.stat().st_mtime)
+
+SYSTEM_MSG = {"role": "system", "content": SYSTEM_LOGIC}
+CHAT_SYSTEM_MSG = {"role": "system", "content": "You are a helpful Senior Python Developer."}
+# SIMPLIFIED MODEL SELECTOR (Text Only - Stable)
+MODELS = (
+    "llama-3.3-70b-versatile",      # Best for Logic & Code
+    "llama-3.1-8b-instant"          # Faster, for simple tasks
+)
+# Builder completion budget; a cut-off reply is retried once with twice this
+BUILD_MAX_TOKENS = 8000
+README_TMPL = (
+    "Create a professional GitHub README.md for '{name}'.\n"
+    "Description: {desc}\n"
+    "Include: Features, Installation, Usage, and a Technical Report section."
+)
+
+@st.cache_resource(max_entries=32, ttl=3600)
+def get_groq_client(api_key: str):
+    """One Groq client (and HTTP connection pool) per API key, reused across reruns.
+
+    Bounded so visitors' one-off keys don't each keep a connection pool alive forever.
+    """
+    # Imported here so sessions that never get past the API key screen skip loading the SDK
+    import httpx
+    from groq import Groq
+
+    # HTTP/2 lets concurrent streams share one TLS connection
+    http_client = httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=30),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+    return Groq(api_key=api_key, http_client=http_client)
+
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+def cached_completion(model: str, system_hash: str, user: str, temperature: float, max_tokens: int, _response=None) -> str:
+    """Finished completions keyed on the request that produced them.
+
+    Look up with `_response=None`: a miss raises LookupError, and Streamlit never
+    caches exceptions, so the slot stays empty. Once the streamed reply is
+    complete, call again with `_response=text` to store it.
+    """
+    if _response is None:
+        raise LookupError(user)
+    return _response
+
+def split_code(text):
+    """(code, text after it) for the first python-tagged fence, else the first untagged one; None if neither."""
+    blocks = list(_FENCE_RE.finditer(text))
+    m = (next((b for b in blocks if (b["info"].split() or [""])[0].lower() in _PYTHON_TAGS), None)
+         or next((b for b in blocks if not b["info"].strip()), None))
+    if m is None:
+        return None
+    return m["code"].rstrip("\r\n"), text[m.end():]
+
+def stream_deltas(stream, meta=None):
+    """Yield the text deltas of a streamed chat completion; the finish_reason lands in `meta` if given."""
+    for chunk in stream:
+        choice = chunk.choices[0]
+        if meta is not None and choice.finish_reason:
+            meta["finish_reason"] = choice.finish_reason
+        yield choice.delta.content or ""
+
+def stable_stream(deltas):
+    """Re-chunk streamed Markdown so a half-written ``` fence is never rendered.
+
+    The current line is held back only while it can still become a fence (nothing
+    but backticks so far, or ``` plus an unfinished info string). Otherwise only
+    a run of trailing backticks waits for the next delta.
+    """
+    pending = ""
+    for delta in deltas:
+        pending += delta
+        line_start = pending.rfind("\n") + 1
+        line = pending[line_start:].lstrip(" \t")
+        maybe_fence = line.startswith("`") and (not line.strip("`") or line.startswith("```"))
+        cut = line_start if maybe_fence else len(pending.rstrip("`"))
+        if cut:
+            yield pending[:cut]
+            pending = pending[cut:]
+    if pending:
+        yield pending
+
+# Chat context sent to Groq: greeting + recent turns, older turns folded into a summary
+MAX_TURNS = 12
+MAX_HISTORY = 100
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def summarize_turns(model: str, summary: str, turns: tuple, _client) -> str:
+    """Fold one block of (role, content) chat turns into the running summary."""
+    transcript = "\n\n".join(f"{role}: {content}" for role, content in turns)
+    if summary:
+        transcript = f"Summary so far:\n{summary}\n\nNew messages:\n{transcript}"
+    res = _client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "Summarize this developer chat in a few bullet points. Keep code names, errors and decisions."},
+            {"role": "user", "content": transcript}
+        ],
+        temperature=0.1,
+        max_tokens=512
+    )
+    return res.choices[0].message.content
+
+def trim_history(history, model, client):
+    """Greeting + the last MAX_TURNS..2*MAX_TURNS messages, with anything older summarized.
+
+    Older turns are folded one MAX_TURNS block at a time into a running summary kept
+    in session state, so each summary request only carries the previous summary and
+    one block. If summarizing fails, just the greeting and the last MAX_TURNS go out.
+    """
+    n_fold = (len(history) - 1 - MAX_TURNS) // MAX_TURNS * MAX_TURNS
+    if n_fold <= 0:
+        return history
+    try:
+        while st.session_state.get("chat_folded", 0) < n_fold:
+            start = 1 + st.session_state.get("chat_folded", 0)
+            block = tuple((m["role"], m["content"]) for m in history[start:start + MAX_TURNS])
+            with st.spinner("Summarizing earlier conversation..."):
+                st.session_state.chat_summary = summarize_turns(
+                    model, st.session_state.get("chat_summary", ""), block, client
+                )
+            st.session_state.chat_folded = start - 1 + MAX_TURNS
+    except Exception:
+        return history[:1] + history[-MAX_TURNS:]
+    summary = {"role": "system", "content": "Earlier conversation: " + st.session_state.chat_summary}
+    return [history[0], summary, *history[1 + n_fold:]]
+
+def remember(history, role, content):
+    """Append a chat message; past MAX_HISTORY, drop the oldest MAX_TURNS block after the greeting.
+
+    Dropping a whole block keeps trim_history's fold boundaries aligned. That block
+    is already part of the running summary, so only the fold counter moves back.
+    """
+    history.append({"role": role, "content": content})
+    if len(history) > MAX_HISTORY:
+        del history[1:1 + MAX_TURNS]
+        st.session_state.chat_folded = max(0, st.session_state.get("chat_folded", 0) - MAX_TURNS)
+
+def submit_batch(client, jobs, timeout=120, poll_every=2):
+    """Run chat-completion jobs ({custom_id: request body}) through Groq's Batch API.
+
+    Returns {custom_id: choice dict} (message + finish_reason). Raises TimeoutError if the batch is not done
+    within `timeout` seconds, so callers can fall back to a normal request.
+    """
+    lines = [
+        json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+        for custom_id, body in jobs.items()
+    ]
+    batch_file = client.files.create(file=("batch.jsonl", "\n".join(lines).encode()), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+
+    deadline = time.monotonic() + timeout
+    while batch.status != "completed":
+        if batch.status in ("failed", "expired", "cancelled"):
+            raise RuntimeError(f"Batch {batch.id} {batch.status}")
+        if time.monotonic() > deadline:
+            client.batches.cancel(batch.id)
+            raise TimeoutError(f"Batch {batch.id} still {batch.status} after {timeout}s")
+        time.sleep(poll_every)
+        batch = client.batches.retrieve(batch.id)
+
+    results = {}
+    for line in client.files.content(batch.output_file_id).read().decode().splitlines():
+        row = json.loads(line)
+        results[row["custom_id"]] = row["response"]["body"]["choices"][0]
+    return results
 
 # --- 4. APP INTERFACE ---
 st.title("🚀 LogicForge: AI Architect (Text Edition)")
@@ -58,110 +219,188 @@ with st.sidebar:
     else:
         st.success("API Key Connected ✅")
     
-    # SIMPLIFIED MODEL SELECTOR (Text Only - Stable)
-    model = st.selectbox("Select Model", [
-        "llama-3.3-70b-versatile",      # Best for Logic & Code
-        "llama-3.1-8b-instant"          # Faster, for simple tasks
-    ], index=0)
+    model = st.selectbox("Select Model", MODELS, index=0)
 
 if not api_key:
     st.warning("⚠️ Enter Groq API Key to start.")
     st.stop()
 
-client = Groq(api_key=api_key)
+client = get_groq_client(api_key)
 
 # --- TABS FOR WORKFLOW ---
 tab_build, tab_chat, tab_docs = st.tabs(["🏗️ Build App", "💬 AI Chat & Fixer", "📄 Write Docs"])
 
+# Each tab body is a fragment: its own widgets only rerun that tab, not the whole script.
+
 # === TAB 1: BUILDER (Text Only) ===
-with tab_build:
+@st.fragment
+def _render_build():
     st.markdown("### Describe your App Idea")
-    user_requirement = st.text_area("Be specific for better results:", height=150, placeholder="E.g. Create a fully functional Tetris game with score tracking and restart button.")
+    # A form only reruns on submit, not on every keystroke in the text area
+    with st.form("build_form", border=False):
+        user_requirement = st.text_area("Be specific for better results:", key="build_prompt", height=150, placeholder="E.g. Create a fully functional Tetris game with score tracking and restart button.")
+        build_clicked = st.form_submit_button("🚀 Build Full Code", type="primary", use_container_width=True)
     
-    if st.button("🚀 Build Full Code", type="primary", use_container_width=True):
+    if build_clicked:
         if user_requirement:
-            with st.spinner("Architecting complex solution (this may take a moment)..."):
+            try:
+                task = f"Task: {user_requirement}"
                 try:
-                    messages = [
-                        {"role": "system", "content": SYSTEM_LOGIC},
-                        {"role": "user", "content": f"Task: {user_requirement}"}
-                    ]
-                    
-                    # We use a high token limit to ensure the code doesn't get cut off
-                    resp = client.chat.completions.create(
-                        model=model,
-                        messages=messages,
-                        temperature=0.1,
-                        max_tokens=8000
-                    )
-                    full_res = resp.choices[0].message.content
-                    
-                    if "```python" in full_res:
-                        parts = full_res.split("```python")
-                        code = parts[1].split("```")[0]
-                        explanation = parts[1].split("```")[1]
-                        st.code(code, language='python')
-                        st.markdown(explanation)
+                    # Same model + prompt as an earlier build: reuse the finished answer
+                    full_res = cached_completion(model, SYSTEM_HASH, task, 0.1, BUILD_MAX_TOKENS)
+                except LookupError:
+                    messages = [SYSTEM_MSG, {"role": "user", "content": task}]
+
+                    # Live progress from the first token on, instead of a spinner for the whole call
+                    with st.status("Architecting complex solution (this may take a moment)...", expanded=True) as status:
+                        # We use a high token limit to ensure the code doesn't get cut off,
+                        # and retry once with double the budget if it still is
+                        budgets = [BUILD_MAX_TOKENS, 2 * BUILD_MAX_TOKENS]
+
+                        # Show tokens as they arrive, then split code/explanation once at the end
+                        # (redrawn at most ~10x/s: every redraw resends the whole block)
+                        placeholder = st.empty()
+                        for attempt, max_tokens in enumerate(budgets, 1):
+                            resp = client.chat.completions.create(
+                                model=model,
+                                messages=messages,
+                                temperature=0.1,
+                                max_tokens=max_tokens,
+                                stream=True
+                            )
+
+                            buf = []
+                            n_chars = 0
+                            last = 0.0
+                            meta = {}
+                            for delta in stream_deltas(resp, meta):
+                                buf.append(delta)
+                                n_chars += len(delta)
+                                now = time.monotonic()
+                                if now - last > 0.1:
+                                    placeholder.code("".join(buf), language='python')
+                                    status.update(label=f"Architecting... {n_chars:,} characters so far")
+                                    last = now
+                            if meta.get("finish_reason") != "length" or attempt == len(budgets):
+                                break
+                            status.update(label=f"Hit the {max_tokens:,}-token limit, retrying with a larger budget...")
+                        placeholder.empty()
+                        truncated = meta.get("finish_reason") == "length"
+                        if truncated:
+                            status.update(label=f"Cut off at the {max_tokens:,}-token limit after {n_chars:,} characters", state="error", expanded=False)
+                        else:
+                            status.update(label=f"Generated {n_chars:,} characters", state="complete", expanded=False)
+                    full_res = "".join(buf)
+
+                    # A reply still cut off after the retry is shown but not cached, so "Build" again really retries
+                    if truncated:
+                        st.warning("⚠️ The response hit the token limit, so the code may be incomplete. Try a narrower request.")
                     else:
-                        st.markdown(full_res)
-                except Exception as e:
-                    st.error(f"Error: {e}")
+                        full_res = cached_completion(model, SYSTEM_HASH, task, 0.1, BUILD_MAX_TOKENS, _response=full_res)
+                
+                parts = split_code(full_res)
+                if parts:
+                    code, explanation = parts
+                    st.code(code, language='python')
+                    st.markdown(explanation)
+                else:
+                    st.markdown(full_res)
+            except Exception as e:
+                st.error(f"Error: {e}")
         else:
             st.warning("Please describe your app first.")
 
+with tab_build:
+    _render_build()
+
 # === TAB 2: AI CHAT & FIXER ===
-with tab_chat:
+@st.fragment
+def _render_chat():
     st.markdown("### 💬 Chat with Senior Developer")
     
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = [
-            {"role": "assistant", "content": "Hello! I'm ready to help you fix bugs or explain code."}
-        ]
+    st.session_state.setdefault("chat_history", [
+        {"role": "assistant", "content": "Hello! I'm ready to help you fix bugs or explain code."}
+    ])
 
     for msg in st.session_state.chat_history:
         st.chat_message(msg["role"]).write(msg["content"])
 
-    if user_input := st.chat_input("Type your message or paste error..."):
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
+    if user_input := st.chat_input("Type your message or paste error...", key="chat_input"):
+        remember(st.session_state.chat_history, "user", user_input)
         st.chat_message("user").write(user_input)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    messages = [{"role": "system", "content": "You are a helpful Senior Python Developer."}]
-                    for m in st.session_state.chat_history:
-                        messages.append({"role": m["role"], "content": m["content"]})
-
-                    response = client.chat.completions.create(
-                        model=model,
-                        messages=messages,
-                        temperature=0.3
-                    )
-                    reply = response.choices[0].message.content
-                    st.markdown(reply)
-                    st.session_state.chat_history.append({"role": "assistant", "content": reply})
-                    
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            try:
+                messages = [CHAT_SYSTEM_MSG, *trim_history(st.session_state.chat_history, model, client)]
+
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=4096,
+                    stream=True
+                )
+                meta = {}
+                reply = st.write_stream(stable_stream(stream_deltas(response, meta)))
+                if meta.get("finish_reason") == "length":
+                    st.warning("⚠️ The reply hit the token limit and may be incomplete. Ask me to continue.")
+                remember(st.session_state.chat_history, "assistant", reply)
+                
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+with tab_chat:
+    _render_chat()
 
 # === TAB 3: DOCS GENERATOR ===
-with tab_docs:
+@st.fragment
+def _render_docs():
     st.markdown("### 📝 Generate Documentation")
     
-    app_name = st.text_input("App Name", placeholder="e.g. Candy Crush Clone")
-    app_desc = st.text_area("Description", placeholder="What features does it have?", height=100)
+    with st.form("docs_form", border=False):
+        app_name = st.text_input("App Name", key="docs_name", placeholder="e.g. Candy Crush Clone")
+        app_desc = st.text_area("Description", key="docs_desc", placeholder="What features does it have?", height=100)
+        use_batch = st.checkbox("Use Batch API (cheaper; if not done in 2 minutes, generates directly)")
+        docs_clicked = st.form_submit_button("📄 Generate README & Report")
     
-    if st.button("📄 Generate README & Report"):
+    if docs_clicked:
         if app_desc:
             with st.spinner("Writing Professional Docs..."):
-                prompt = f"""
-                Create a professional GitHub README.md for '{app_name}'.
-                Description: {app_desc}
-                Include: Features, Installation, Usage, and a Technical Report section.
-                """
+                prompt = README_TMPL.format(name=app_name, desc=app_desc)
+                request = {
+                    "model": model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": 0.1,
+                    "max_tokens": 4096
+                }
                 
-                res = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                st.markdown(res.choices[0].message.content)
+                try:
+                    # Docs have no system prompt
+                    st.markdown(cached_completion(model, "", prompt, 0.1, 4096))
+                except LookupError:
+                    docs = None
+                    meta = {}
+                    if use_batch:
+                        try:
+                            choice = submit_batch(client, {"readme": request})["readme"]
+                            meta["finish_reason"] = choice.get("finish_reason")
+                            docs = choice["message"]["content"]
+                        except TimeoutError:
+                            st.info("Batch queue is busy, generating directly instead.")
+                        except Exception as e:
+                            st.info(f"Batch failed ({e}), generating directly instead.")
+                    
+                    if docs is None:
+                        res = client.chat.completions.create(**request, stream=True)
+                        docs = st.write_stream(stable_stream(stream_deltas(res, meta)))
+                    else:
+                        st.markdown(docs)
+
+                    # Same rule as the builder: a cut-off README is shown but not cached
+                    if meta.get("finish_reason") == "length":
+                        st.warning("⚠️ The README hit the token limit and may be incomplete.")
+                    else:
+                        cached_completion(model, "", prompt, 0.1, 4096, _response=docs)
+
+with tab_docs:
+    _render_docs()